@@ -33,13 +33,18 @@
 # For more information, see http://arxiv.org/help/robots
 #
 # This script usually makes only one call to arxiv.org per run.
-# No caching of any kind is performed.
+# No caching is performed unless a cache file is given with --cache.
 
 from __future__ import print_function
 from xml.etree import ElementTree
 import sys
 import re
 import os
+import io
+import contextlib
+import sqlite3
+import subprocess
+import time
 
 if sys.version_info < (2, 6):
     raise Exception("Python 2.6 or higher required")
@@ -57,6 +62,12 @@ else:
     print_bytes = lambda s: sys.stdout.write(s)
 
 
+# arxiv API endpoint
+API_URL = "http://export.arxiv.org/api/query"
+
+# ids per API request; larger chunks risk HTTP 414 (URI too long)
+CHUNK_SIZE = 100
+
 # Namespaces
 ATOM = '{http://www.w3.org/2005/Atom}'
 ARXIV = '{http://arxiv.org/schemas/atom}'
@@ -95,12 +106,124 @@ OLD_STYLE = re.compile(r"""(?x)
       |NT|NA|OA|OC|PR|QA|RT|RA|SP|ST|SG))?
 )/\d{7}(v\d+)?$""")
 
+# regular expressions to read BibTeX files
+BIBTEX_START = re.compile(r'@\s*(\w+)\s*([{(])')
+BIBTEX_FIELD = re.compile(r'\s*,?\s*([^\s=,{}()#"]+)\s*=\s*')
+BIBTEX_WORD = re.compile(r'[^\s,#{}()"]+')
+BIBTEX_CONCAT = re.compile(r'\s*#\s*')
+BIBTEX_DELIMITER = re.compile(r'[{}()"]')
+
+# BibTeX fields, in output order
+FIELDS = ("Author", "Title", "Eprint", "DOI", "ArchivePrefix", "PrimaryClass",
+          "Abstract", "Year", "Month", "Note", "Url", "File")
+
+# entry elements always kept: enough to identify a paper or see it is missing
+REQUIRED_ELEMENTS = (ATOM + "id", ATOM + "updated", ATOM + "title",
+                     ATOM + "author")
+
+# fields that can be output from the required elements alone
+REQUIRED_FIELDS = frozenset(["author", "title", "eprint", "archiveprefix",
+                             "url", "file"])
+
+# other entry elements needed by each field
+FIELD_ELEMENTS = {"abstract": ATOM + "summary",
+                  "doi": ARXIV + "doi",
+                  "primaryclass": ARXIV + "primary_category",
+                  "year": ATOM + "published",
+                  "month": ATOM + "published",
+                  "note": ARXIV + "journal_ref"}
+
+# citation key schemes; "keep" keeps the key of an existing BibTeX entry
+KEY_SCHEMES = ("keep", "id", "bare", "author-year-title")
+
+# title words skipped when building author-year-title keys
+STOP_WORDS = frozenset(["a", "an", "and", "for", "in", "of", "on", "the",
+                        "to", "with"])
+
 
 def is_valid(arxiv_id):
     """Checks if id resembles a valid arxiv identifier."""
     return bool(NEW_STYLE.match(arxiv_id)) or bool(OLD_STYLE.match(arxiv_id))
 
 
+def strip_version(arxiv_id):
+    """arxiv id without its version suffix"""
+    return re.sub(r'v\d+$', '', arxiv_id)
+
+
+def citation_key(scheme, arxiv_id, authors=(), year="", title=""):
+    """Builds a citation key using one of KEY_SCHEMES.
+
+    The author-year-title scheme produces keys like Judge2010chromosphere
+    and falls back to arxiv_id if any of the parts is missing. With no
+    existing key to keep, "keep" is the same as "id".
+    """
+    if scheme in ("keep", "id"):
+        return arxiv_id
+    if scheme == "bare":
+        return strip_version(arxiv_id)
+    if scheme != "author-year-title":
+        raise ValueError("Unknown key scheme: " + scheme)
+
+    name = last_name(authors[0]) if authors else ""
+    words = [w for w in title_words(title) if w not in STOP_WORDS]
+    if not (name and year and words):
+        return arxiv_id
+    return name + year + words[0]
+
+
+def last_name(author):
+    """Last name of an author written as "First Last" or "Last, First" """
+    name = author.split(",")[0].split()
+    return "".join(c for c in name[-1] if c.isalnum()) if name else ""
+
+
+def title_words(title):
+    """Lowercase alphanumeric words of a title, ignoring TeX markup"""
+    return re.sub(r'(?u)\\[a-zA-Z]+|[^\w\s]|_', ' ', title.lower()).split()
+
+
+def unique_key(key, used):
+    """Returns key, or key with b, c, ... appended if it is in used.
+
+    The returned key is added to used.
+    """
+    unique = key
+    suffix = ord('b')
+    while unique in used:
+        unique = key + chr(suffix)
+        suffix += 1
+    used.add(unique)
+    return unique
+
+
+class Verbatim(str):
+    """Field value written without braces: a macro, number or concatenation"""
+
+
+def format_bibtex(entry_type, key, fields):
+    """BibTeX string for an entry. Fields with empty values are left out."""
+    lines = ["@" + entry_type + "{" + key]
+    for k, v in fields:
+        if isinstance(v, Verbatim):
+            lines.append("%-13s = %s" % (k, v))
+        elif len(v):
+            lines.append("%-13s = {%s}" % (k, v))
+
+    return ("," + os.linesep).join(lines) + os.linesep + "}"
+
+
+def normalize_fields(fields):
+    """Lowercase set of field names, or None for all fields"""
+    if fields is None:
+        return None
+    fields = frozenset(field.strip().lower() for field in fields)
+    unknown = fields - set(field.lower() for field in FIELDS)
+    if unknown:
+        raise ValueError("Unknown field: " + ", ".join(sorted(unknown)))
+    return fields
+
+
 class FatalError(Exception):
     """Error that prevents us from continuing"""
 
@@ -113,23 +236,36 @@ class Reference(object):
     """Represents a single reference.
 
     Instantiate using Reference(entry_xml). Note entry_xml should be
-    an ElementTree.Element object.
+    an ElementTree.Element object. If fields is given, only those BibTeX
+    fields are extracted and output.
     """
-    def __init__(self, entry_xml):
+    def __init__(self, entry_xml, fields=None):
         self.xml = entry_xml
+        self.fields = normalize_fields(fields)
         self.url = self._field_text('id')
         self.id = self._id()
-        self.authors = self._authors()
-        self.title = self._field_text('title')
-        if len(self.id) == 0 or len(self.authors) == 0 or len(self.title) == 0:
+        self.authors = self._authors() if self._wants('author') else []
+        self.title = self._field_text('title') if self._wants('title') else ""
+        if len(self.id) == 0 or self.xml.find(ATOM + 'author') is None or \
+                len(self.title or self._field_text('title')) == 0:
             raise NotFoundError("No such publication", self.id)
-        self.summary = self._field_text('summary')
-        self.category = self._category()
-        self.year, self.month = self._published()
+        self.summary = self._field_text('summary') \
+            if self._wants('abstract') else ""
+        self.category = self._category() if self._wants('primaryclass') else ""
+        if self._wants('year') or self._wants('month'):
+            self.year, self.month = self._published()
+        else:
+            self.year, self.month = "", ""
         self.updated = self._field_text('updated')
         self.bare_id = self.id[:self.id.rfind('v')]
-        self.note = self._field_text('journal_ref', namespace=ARXIV)
-        self.doi = self._field_text('doi', namespace=ARXIV)
+        self.note = self._field_text('journal_ref', namespace=ARXIV) \
+            if self._wants('note') else ""
+        self.doi = self._field_text('doi', namespace=ARXIV) \
+            if self._wants('doi') else ""
+
+    def _wants(self, field):
+        """Whether field was requested"""
+        return self.fields is None or field in self.fields
 
     def _authors(self):
         """Extracts author names from xml."""
@@ -171,11 +307,19 @@ class Reference(object):
             pass
         return y, m
 
-    def bibtex(self):
-        """BibTex string of the reference."""
+    def key(self, scheme="id"):
+        """Citation key using one of KEY_SCHEMES
+
+        The parts are read from the xml, so the key does not depend on
+        which fields are output; the year needs the published element.
+        """
+        return citation_key(scheme, self.id, self._authors(),
+                            self._published()[0], self._field_text('title'))
 
-        lines = ["@article{" + self.id]
-        for k, v in [("Author", " and ".join(self.authors)),
+    def bibtex(self, key=None):
+        """BibTex string of the reference, using key or else the id."""
+
+        fields = [(k, v) for k, v in [("Author", " and ".join(self.authors)),
                     ("Title", self.title),
                     ("Eprint", self.id),
                     ("DOI", self.doi),
@@ -187,11 +331,9 @@ class Reference(object):
                     ("Note", self.note),
                     ("Url", self.url),
                     ("File", self.id + ".pdf"),
-                    ]:
-            if len(v):
-                lines.append("%-13s = {%s}" % (k, v))
+                    ] if self._wants(k.lower())]
 
-        return ("," + os.linesep).join(lines) + os.linesep + "}"
+        return format_bibtex("article", key or self.id, fields)
 
 
 class ReferenceErrorInfo(object):
@@ -213,9 +355,9 @@ class ReferenceErrorInfo(object):
                 {'id': self.id, 'message': self.message}
 
 
-def arxiv2bib(id_list):
+def arxiv2bib(id_list, cache=None, revalidate=False, fields=None):
     """Returns a list of references, corresponding to elts of id_list"""
-    d = arxiv2bib_dict(id_list)
+    d = arxiv2bib_dict(id_list, cache, revalidate, fields)
     l = []
     for id in id_list:
         try:
@@ -226,35 +368,85 @@ def arxiv2bib(id_list):
     return l
 
 
-def arxiv_request(ids):
-    """Sends a request to the arxiv API."""
+def arxiv_request(ids, fields=None):
+    """Sends a request to the arxiv API.
+
+    If fields is given, the response is parsed incrementally and elements
+    that are not needed for those fields are dropped as they are parsed.
+    """
     q = urlencode([
          ("id_list", ",".join(ids)),
          ("max_results", len(ids))
          ])
-    xml = urlopen("http://export.arxiv.org/api/query?" + q)
+    xml = urlopen(API_URL + "?" + q)
+    if fields is not None:
+        return parse_pruned(xml, fields)
     # xml.read() returns bytes, but ElementTree.fromstring decodes
     # to unicode when needed (python2) or string (python3)
     return ElementTree.fromstring(xml.read())
 
 
-def arxiv2bib_dict(id_list):
-    """Fetches citations for ids in id_list into a dictionary indexed by id"""
-    ids = []
-    d = {}
+def kept_elements(fields):
+    """Tags of the entry elements needed to output fields"""
+    kept = set(REQUIRED_ELEMENTS)
+    kept.update(FIELD_ELEMENTS[field] for field in normalize_fields(fields)
+                if field in FIELD_ELEMENTS)
+    return kept
 
-    # validate ids
-    for id in id_list:
-        if is_valid(id):
-            ids.append(id)
-        else:
-            d[id] = ReferenceErrorInfo("Invalid arXiv identifier", id)
 
-    if len(ids) == 0:
-        return d
+def held_fields(fields):
+    """All fields that can be output from the elements kept for fields"""
+    kept = kept_elements(fields)
+    return REQUIRED_FIELDS | frozenset(
+      field for field, tag in FIELD_ELEMENTS.items() if tag in kept)
+
+
+def prune_entry(entry, fields):
+    """Copy of entry without the elements that are not needed for fields"""
+    kept = kept_elements(fields)
+    pruned = ElementTree.Element(entry.tag, entry.attrib)
+    pruned.extend(child for child in entry if child.tag in kept)
+    return pruned
 
-    # Split into chunks of 100 (adjust `chunk_size` here if needed) to avoid HTTP 414 (URI too long).
-    chunk_size = 100
+
+def parse_pruned(source, fields):
+    """Parses an API response, dropping elements unused by fields.
+
+    Each element is dropped as soon as it has been parsed, so the text of
+    unused fields is never held for more than one element at a time.
+    """
+    kept = kept_elements(fields)
+    root = None
+    stack = []
+    is_error = False
+    for event, elem in ElementTree.iterparse(source, ('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            elif elem.tag == ATOM + 'entry':
+                is_error = False
+            stack.append(elem)
+            continue
+        stack.pop()
+        if not stack:
+            continue
+        parent = stack[-1]
+        if parent.tag == ATOM + 'entry':
+            # error entries carry the offending id in their summary
+            if elem.tag == ATOM + 'title' and \
+                    (elem.text or '').strip() == 'Error':
+                is_error = True
+            if not is_error and elem.tag not in kept:
+                parent.remove(elem)
+        elif parent is root and elem.tag != ATOM + 'entry':
+            root.remove(elem)
+    return root
+
+
+def fetch_entries(ids, fields=None):
+    """Fetches the raw xml entries for ids from the arxiv API."""
+    # Split into chunks to avoid HTTP 414 (URI too long).
+    chunk_size = CHUNK_SIZE
     chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
 
     # make the api calls
@@ -263,7 +455,7 @@ def arxiv2bib_dict(id_list):
         current_ids = list(chunk)
         while True:
             try:
-                xml = arxiv_request(current_ids)
+                xml = arxiv_request(current_ids, fields)
             except Exception as e:
                 raise FatalError(f"Failed to process chunk: {e}")
 
@@ -285,10 +477,292 @@ def arxiv2bib_dict(id_list):
                 entries.extend(entries_xml)
                 break
 
+    return entries
+
+
+class Cache(object):
+    """SQLite cache of arxiv entries that can be shared between processes.
+
+    The database is opened in WAL mode, so many processes can read while
+    one writes. Ids that are missing from the cache are claimed before
+    they are fetched; a process that finds an id already claimed waits for
+    the other process to store it instead of fetching it a second time.
+    Ids that arxiv does not know are stored too, so that waiting processes
+    get an answer; they expire after not_found_ttl seconds.
+
+    Entries fetched more than max_age seconds ago are stale. They are still
+    returned, but can be checked against arxiv with revalidate().
+    """
+    def __init__(self, path, max_age=None, wait_timeout=60,
+                 poll_interval=0.1, not_found_ttl=3600):
+        self.path = path
+        self.max_age = max_age
+        self.wait_timeout = wait_timeout
+        self.not_found_ttl = not_found_ttl
+        self.poll_interval = poll_interval
+        self.db = sqlite3.connect(path, timeout=wait_timeout,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                             key TEXT PRIMARY KEY,
+                             id TEXT,
+                             bare_id TEXT,
+                             updated TEXT,
+                             fetched REAL,
+                             fields TEXT,
+                             xml BLOB)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS claims (
+                             key TEXT PRIMARY KEY,
+                             pid INTEGER,
+                             started REAL)""")
+
+    def close(self):
+        self.db.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Runs the enclosed statements in a single write transaction.
+
+        The connection is in autocommit mode, so without this every
+        statement would commit (and sync) on its own.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+    def get(self, ids, fields=None):
+        """Returns a dictionary of cached xml entries for the ids found
+
+        Ids known not to exist map to None. Entries stored with fewer
+        fields than requested are not returned.
+        """
+        fields = normalize_fields(fields)
+        not_found_cutoff = time.time() - self.not_found_ttl
+        found = {}
+        for id in ids:
+            row = self.db.execute(
+              "SELECT fields, xml, fetched FROM entries WHERE key = ?",
+              (id,)).fetchone()
+            if row is None:
+                continue
+            if row[1] is None:
+                if row[2] >= not_found_cutoff:
+                    found[id] = None
+                continue
+            if row[0] is not None and (fields is None or
+                                       not fields <= set(row[0].split(','))):
+                continue
+            found[id] = ElementTree.fromstring(bytes(row[1]))
+        return found
+
+    @staticmethod
+    def _match(ids, entries, fields=None):
+        """Pairs each of the requested ids with the newest entry answering it
+
+        Returns a dictionary of (Reference, entry) tuples indexed by id.
+        """
+        matches = {}
+        for entry in entries:
+            try:
+                ref = Reference(entry, fields)
+            except NotFoundError:
+                continue
+            for key in (ref.id, ref.bare_id):
+                if key in ids and (key not in matches or
+                                   matches[key][0].updated < ref.updated):
+                    matches[key] = (ref, entry)
+        return matches
+
+    def put(self, ids, entries, fields=None):
+        """Stores entries under each of the requested ids they answer
+
+        Ids with no entry are stored as not found. If fields is given,
+        elements not needed for them are removed before storing, and the
+        rows are tagged with the fields they can still produce.
+        """
+        fields = normalize_fields(fields)
+        if fields is None:
+            stored = None
+        else:
+            stored = ",".join(sorted(held_fields(fields)))
+        now = time.time()
+        matches = self._match(ids, entries, fields)
+        if fields is not None:
+            matches = dict((key, (ref, prune_entry(entry, fields)))
+                           for key, (ref, entry) in matches.items())
+        rows = [(key, ref.id, ref.bare_id, ref.updated, now, stored,
+                 sqlite3.Binary(ElementTree.tostring(entry)))
+                for key, (ref, entry) in matches.items()]
+        rows.extend((id, id, strip_version(id), '0', now, None, None)
+                    for id in set(ids) if id not in matches)
+        if rows:
+            with self.transaction():
+                self.db.executemany(
+                  "INSERT OR REPLACE INTO entries "
+                  "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def stale(self, ids):
+        """Returns the cached ids that were fetched more than max_age ago"""
+        if self.max_age is None:
+            return []
+        cutoff = time.time() - self.max_age
+        return [id for id in ids if self.db.execute(
+          "SELECT 1 FROM entries "
+          "WHERE key = ? AND fetched < ? AND xml IS NOT NULL",
+          (id, cutoff)).fetchone()]
+
+    def revalidate(self, ids, fields=None):
+        """Checks cached ids against arxiv in batches of CHUNK_SIZE ids.
+
+        Only entries with a new version, journal reference or DOI are
+        rewritten; the rest, including ids missing from the response, are
+        just marked as fresh. Ids being revalidated by another process are
+        skipped. Returns the list of ids whose entries changed.
+        """
+        mine = self.claim(ids)
+        try:
+            if not mine:
+                return []
+            cached = self._match(
+              mine, [e for e in self.get(mine, fields).values() if e], fields)
+            fetched = self._match(mine, fetch_entries(mine, fields), fields)
+            changed, unchanged = [], []
+            for id in mine:
+                if id not in fetched:
+                    # withdrawn or failed; keep what we have until next time
+                    unchanged.append(id)
+                    continue
+                new = fetched[id][0]
+                old = cached[id][0] if id in cached else None
+                if old is not None and (old.id, old.note, old.doi) == \
+                        (new.id, new.note, new.doi):
+                    unchanged.append(id)
+                else:
+                    changed.append(id)
+            self.put(changed, [fetched[id][1] for id in changed], fields)
+            with self.transaction():
+                self.db.executemany(
+                  "UPDATE entries SET fetched = ? WHERE key = ?",
+                  [(time.time(), id) for id in unchanged])
+        finally:
+            self.release(mine)
+        return changed
+
+    def claim(self, ids):
+        """Claims ids for fetching. Returns the ids claimed by us."""
+        now = time.time()
+        claimed = []
+        with self.transaction():
+            # a claim that outlived the timeout belongs to a dead process
+            self.db.execute("DELETE FROM claims WHERE started < ?",
+                            (now - self.wait_timeout,))
+            for id in ids:
+                cursor = self.db.execute(
+                  "INSERT OR IGNORE INTO claims VALUES (?, ?, ?)",
+                  (id, os.getpid(), now))
+                if cursor.rowcount == 1:
+                    claimed.append(id)
+        return claimed
+
+    def release(self, ids):
+        """Releases claims made by this process"""
+        with self.transaction():
+            self.db.executemany(
+              "DELETE FROM claims WHERE key = ? AND pid = ?",
+              [(id, os.getpid()) for id in ids])
+
+    def wait(self, ids, fields=None):
+        """Waits for other processes to fetch ids.
+
+        Returns the entries that were stored, and a list of ids that were
+        released without a result or are still claimed after wait_timeout.
+        """
+        found = {}
+        pending = list(ids)
+        deadline = time.time() + self.wait_timeout
+        while pending and time.time() < deadline:
+            # check the claims before reading, so that a result stored
+            # just before its claim is released is not missed
+            claimed = [id for id in pending if self.db.execute(
+              "SELECT 1 FROM claims WHERE key = ?", (id,)).fetchone()]
+            found.update(self.get(pending, fields))
+            pending = [id for id in claimed if id not in found]
+            if pending:
+                time.sleep(self.poll_interval)
+        missing = [id for id in ids if id not in found]
+        return found, missing
+
+    def entries(self, ids, revalidate=False, fields=None):
+        """Returns xml entries for ids, fetching only what is missing
+
+        If revalidate is true, stale entries are revalidated first.
+        """
+        if revalidate:
+            self.revalidate(self.stale(ids), fields)
+        found = self.get(ids, fields)
+        missing = []
+        for id in ids:
+            if id not in found and id not in missing:
+                missing.append(id)
+        if not missing:
+            return [entry for entry in found.values() if entry is not None]
+
+        mine = self.claim(missing)
+        try:
+            # another process may have finished between get() and claim()
+            found.update(self.get(mine, fields))
+            to_fetch = [id for id in mine if id not in found]
+            fetched = fetch_entries(to_fetch, fields) if to_fetch else []
+            self.put(to_fetch, fetched, fields)
+        finally:
+            self.release(mine)
+
+        others = [id for id in missing if id not in mine]
+        if others:
+            waited, missing = self.wait(others, fields)
+            found.update(waited)
+            if missing:
+                late = fetch_entries(missing, fields)
+                self.put(missing, late, fields)
+                fetched.extend(late)
+        return [entry for entry in found.values() if entry is not None] + \
+            fetched
+
+
+def arxiv2bib_dict(id_list, cache=None, revalidate=False, fields=None):
+    """Fetches citations for ids in id_list into a dictionary indexed by id
+
+    If cache is a Cache object, entries are read from and stored in it.
+    If revalidate is also true, stale cache entries are refreshed first.
+    If fields is a list of BibTeX field names, only those are extracted.
+    """
+    fields = normalize_fields(fields)
+    ids = []
+    d = {}
+
+    # validate ids
+    for id in id_list:
+        if is_valid(id):
+            ids.append(id)
+        else:
+            d[id] = ReferenceErrorInfo("Invalid arXiv identifier", id)
+
+    if len(ids) == 0:
+        return d
+
+    if cache is None:
+        entries = fetch_entries(ids, fields)
+    else:
+        entries = cache.entries(ids, revalidate, fields)
+
     # Parse each reference and store it in dictionary
     for entry in entries:
         try:
-            ref = Reference(entry)
+            ref = Reference(entry, fields)
         except NotFoundError as error:
             message, id = error.args
             ref = ReferenceErrorInfo(message, id)
@@ -301,6 +775,262 @@ def arxiv2bib_dict(id_list):
     return d
 
 
+class BibTeXError(Exception):
+    """BibTeX input that cannot be parsed"""
+
+
+def parse_bibtex(text):
+    """Yields a BibEntry for each block of a BibTeX file, in one pass.
+
+    @comment, @string and @preamble blocks are kept verbatim in raw.
+    Raises BibTeXError, with the line number, on input it cannot parse.
+    """
+    pos = 0
+    while True:
+        start = BIBTEX_START.search(text, pos)
+        if start is None:
+            return
+        close = "}" if start.group(2) == "{" else ")"
+        end = _closing(text, start.end(), close)
+        if end < 0:
+            raise BibTeXError("line %d: unbalanced braces in @%s" %
+                              (_line(text, start), start.group(1)))
+        pos = end + 1
+        entry_type = start.group(1).lower()
+        if entry_type in ("comment", "string", "preamble"):
+            yield BibEntry(entry_type, None, raw=text[start.start():pos])
+            continue
+        body = text[start.end():end]
+        key, _, body = body.partition(",")
+        try:
+            fields = _parse_fields(body)
+        except BibTeXError as error:
+            raise BibTeXError("line %d: %s in @%s{%s" %
+                              (_line(text, start), error.args[0], entry_type,
+                               key.strip()))
+        yield BibEntry(entry_type, key.strip(), fields)
+
+
+def _line(text, match):
+    """Line number of a match; only counted for errors, to stay linear"""
+    return text.count("\n", 0, match.start()) + 1
+
+
+def _closing(text, pos, close):
+    """Index of the first close character at brace depth 0, or -1"""
+    depth = 0
+    for match in BIBTEX_DELIMITER.finditer(text, pos):
+        char = match.group()
+        if char == close and depth == 0:
+            return match.start()
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth < 0:
+                return -1
+    return -1
+
+
+def _parse_fields(body):
+    """Parses name = value pairs from the body of a BibTeX entry"""
+    fields = []
+    pos = 0
+    while True:
+        match = BIBTEX_FIELD.match(body, pos)
+        if match is None:
+            break
+        name, pos = match.group(1), match.end()
+        parts = []
+        while True:
+            start = pos
+            if body.startswith("{", pos) or body.startswith('"', pos):
+                close = "}" if body[pos] == "{" else '"'
+                end = _closing(body, pos + 1, close)
+                if end < 0:
+                    raise BibTeXError("unbalanced value of " + name)
+                pos = end + 1
+            else:
+                word = BIBTEX_WORD.match(body, pos)
+                if word is None:
+                    raise BibTeXError("missing value of " + name)
+                pos = word.end()
+            parts.append(body[start:pos])
+            concat = BIBTEX_CONCAT.match(body, pos)
+            if concat is None:
+                break
+            pos = concat.end()
+        if len(parts) == 1 and parts[0][0] in '{"':
+            fields.append((name, parts[0][1:-1]))
+        else:
+            fields.append((name, Verbatim(" # ".join(parts))))
+    rest = body[pos:].strip(", \t\r\n")
+    if rest:
+        raise BibTeXError("cannot parse %r" % rest[:30])
+    return fields
+
+
+class BibEntry(object):
+    """A BibTeX entry read from a file.
+
+    fields is a list of (name, value) pairs. Blocks that are not entries,
+    such as @comment, have no key and keep their text in raw.
+    """
+    def __init__(self, entry_type, key, fields=(), raw=None):
+        self.type = entry_type
+        self.key = key
+        self.fields = list(fields)
+        self.raw = raw
+
+    def get(self, name):
+        """Value of a field, matched case insensitively"""
+        for k, v in self.fields:
+            if k.lower() == name.lower():
+                return v
+        return ""
+
+    def eprint(self):
+        """arxiv id of the entry, or "" if it has none"""
+        eprint = self.get("Eprint")
+        if eprint.lower().startswith("arxiv:"):
+            eprint = eprint[6:]
+        if not eprint and self.key and is_valid(self.key):
+            eprint = self.key
+        return eprint
+
+    def version(self):
+        """arxiv version number, or 0 if unknown"""
+        match = re.search(r'v(\d+)$', self.eprint())
+        return int(match.group(1)) if match else 0
+
+    def doi(self):
+        """Normalized DOI, or "" if the entry has none"""
+        doi = self.get("DOI").strip().lower()
+        return re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', doi)
+
+    def authors(self):
+        """List of author names"""
+        return [a.strip() for a in self.get("Author").split(" and ")
+                if a.strip()]
+
+    def identifiers(self):
+        """Hashable values that identify the paper this entry describes.
+
+        A title only identifies a paper together with the last name of the
+        first author, or with the year if there are no authors, so that
+        different papers with the same title are kept apart.
+        """
+        if self.raw is not None:
+            return [("raw", self.raw)]
+        identifiers = []
+        if self.doi():
+            identifiers.append(("doi", self.doi()))
+        if self.eprint():
+            identifiers.append(("arxiv", strip_version(self.eprint())))
+        title = " ".join(title_words(self.get("Title")))
+        if title:
+            authors = self.authors()
+            if authors:
+                identifiers.append(("title-author", title,
+                                    last_name(authors[0]).lower()))
+            elif self.get("Year"):
+                identifiers.append(("title-year", title, self.get("Year")))
+        return identifiers
+
+    def merge(self, other):
+        """Combines two entries for the same paper into a new entry.
+
+        The entry with the later arxiv version wins (self on a tie), with
+        fields it lacks filled in from the other one.
+        """
+        if self.raw is not None:
+            return self
+        if other.version() > self.version():
+            return other.merge(self)
+        names = set(k.lower() for k, v in self.fields if v)
+        fields = [(k, v) for k, v in self.fields if v] + \
+                 [(k, v) for k, v in other.fields
+                  if v and k.lower() not in names]
+        return BibEntry(self.type, self.key, fields)
+
+    def citation_key(self, scheme):
+        """Citation key using one of KEY_SCHEMES"""
+        if scheme == "keep":
+            return self.key
+        return citation_key(scheme, self.eprint() or self.key,
+                            self.authors(), self.get("Year"),
+                            self.get("Title"))
+
+    def bibtex(self, key=None):
+        """BibTeX string of the entry"""
+        if self.raw is not None:
+            return self.raw
+        return format_bibtex(self.type, key or self.key, self.fields)
+
+
+class Bibliography(object):
+    """Merges BibTeX entries, collapsing duplicates of the same paper.
+
+    Entries are duplicates if they share a DOI, an arxiv id (ignoring the
+    version) or a normalized title as described in BibEntry.identifiers.
+    Each added entry costs one lookup per identifier in a hash index, and
+    an entry matching several earlier ones joins them all, using
+    union-find over their positions.
+    """
+    def __init__(self, key_scheme="keep"):
+        self.key_scheme = key_scheme
+        self.entries = []
+        self.parent = []
+        self.index = {}
+
+    def _root(self, position):
+        """Position of the entry that position was merged into"""
+        while self.parent[position] != position:
+            self.parent[position] = self.parent[self.parent[position]]
+            position = self.parent[position]
+        return position
+
+    def add(self, entry):
+        """Adds entry, merging it with every earlier duplicate"""
+        roots = []
+        for identifier in entry.identifiers():
+            if identifier in self.index:
+                root = self._root(self.index[identifier])
+                if root not in roots:
+                    roots.append(root)
+        if roots:
+            roots.sort()
+            position = roots[0]
+            merged = self.entries[position]
+            for root in roots[1:]:
+                merged = merged.merge(self.entries[root])
+                self.entries[root] = None
+                self.parent[root] = position
+            merged = merged.merge(entry)
+        else:
+            position = len(self.entries)
+            merged = entry
+            self.parent.append(position)
+            self.entries.append(None)
+        self.entries[position] = merged
+        for identifier in merged.identifiers():
+            self.index.setdefault(identifier, position)
+
+    def bibtex(self):
+        """List of BibTeX strings, with keys unique within the list"""
+        used = set()
+        output = []
+        for entry in self.entries:
+            if entry is None:
+                continue
+            if entry.raw is not None:
+                output.append(entry.bibtex())
+            else:
+                key = unique_key(entry.citation_key(self.key_scheme), used)
+                output.append(entry.bibtex(key))
+        return output
+
+
 class Cli(object):
     """Command line interface"""
 
@@ -308,7 +1038,7 @@ class Cli(object):
         """Parse arguments"""
         self.args = self.parse_args(args)
 
-        if len(self.args.id) == 0:
+        if len(self.args.id) == 0 and not self.args.merge:
             self.args.id = [line.strip() for line in sys.stdin]
 
         # avoid duplicate error messages unless verbose is set
@@ -322,8 +1052,22 @@ class Cli(object):
 
     def run(self):
         """Produce output and error messages"""
+        if self.args.merge:
+            self.merge()
+            return
+
+        cache = None
         try:
-            bib = arxiv2bib(self.args.id)
+            if self.args.cache:
+                cache = Cache(self.args.cache, self.args.max_age)
+            bib = arxiv2bib(self.args.id, cache, self.args.revalidate,
+                            self.args.fields)
+            if cache is not None and not self.args.revalidate:
+                stale = cache.stale(self.args.id)
+                if stale:
+                    self.revalidate_in_background(stale)
+        except sqlite3.Error as error:
+            raise FatalError("Cache error: {0}".format(error))
         except HTTPError as error:
             if error.getcode() == 403:
                 raise FatalError("""\
@@ -336,12 +1080,61 @@ class Cli(object):
             else:
                 raise FatalError(
                   "HTTP Connection Error: {0}".format(error.getcode()))
+        finally:
+            if cache is not None:
+                cache.close()
 
         self.create_output(bib)
         self.code = self.tally_errors(bib)
 
+    def revalidate_in_background(self, ids):
+        """Start a separate process to refresh stale cache entries"""
+        args = [sys.executable, os.path.abspath(__file__), '--revalidate',
+                '--cache', self.args.cache,
+                '--max-age', str(self.args.max_age)]
+        if self.args.fields is not None:
+            args.extend(['--fields', ','.join(self.args.fields)])
+        with open(os.devnull, 'w') as devnull:
+            process = subprocess.Popen(args, stdin=subprocess.PIPE,
+                                       stdout=devnull, stderr=devnull)
+        process.stdin.write("\n".join(ids).encode('ascii'))
+        process.stdin.close()
+        if self.args.verbose:
+            self.messages.append(
+              "Revalidating %s stale cache entries" % len(ids))
+
+    def merge(self):
+        """Merge BibTeX files, removing duplicate papers"""
+        bibliography = Bibliography(self.args.key or "keep")
+        count = 0
+        for name, text in self.read_files(self.args.id):
+            try:
+                for entry in parse_bibtex(text):
+                    bibliography.add(entry)
+                    count += 1
+            except BibTeXError as error:
+                raise FatalError("{0}: {1}".format(name, error.args[0]))
+        self.output = bibliography.bibtex()
+        if self.args.verbose:
+            self.messages.append("Merged %s entries into %s" %
+              (count, len(self.output)))
+
+    @staticmethod
+    def read_files(names):
+        """Name and contents of each file, or of stdin if there are none"""
+        if not names:
+            yield "<stdin>", sys.stdin.read()
+        for name in names:
+            try:
+                with io.open(name, encoding='utf-8') as f:
+                    yield name, f.read()
+            except (IOError, UnicodeDecodeError) as error:
+                raise FatalError("Cannot read {0}: {1}".format(name, error))
+
     def create_output(self, bib):
         """Format the output and error messages"""
+        used = set()
+        assigned = {}
         for b in bib:
             if isinstance(b, ReferenceErrorInfo):
                 self.error_count += 1
@@ -349,8 +1142,15 @@ class Cli(object):
                     self.output.append(b.bibtex())
                 if not self.args.quiet:
                     self.messages.append(str(b))
+            elif self.args.key == "author-year-title":
+                # different papers can share a key in this scheme, but
+                # versions of one paper keep the same key
+                key = b.key(self.args.key)
+                if (key, b.bare_id) not in assigned:
+                    assigned[key, b.bare_id] = unique_key(key, used)
+                self.output.append(b.bibtex(assigned[key, b.bare_id]))
             else:
-                self.output.append(b.bibtex())
+                self.output.append(b.bibtex(b.key(self.args.key or "id")))
 
     def print_output(self):
         if not self.output:
@@ -395,8 +1195,15 @@ class Cli(object):
           epilog="""\
     Returns 0 on success, 1 on partial failure, 2 on total failure.
     Valid BibTeX is written to stdout, error messages to stderr.
-    If no arguments are given, ids are read from stdin, one per line.""",
+    If no arguments are given, ids are read from stdin, one per line.
+    With --merge, the arguments are BibTeX files instead of ids.""",
           formatter_class=argparse.RawDescriptionHelpFormatter)
+        def field_list(string):
+            try:
+                return normalize_fields(string.split(','))
+            except ValueError as error:
+                raise argparse.ArgumentTypeError(error.args[0])
+
         parser.add_argument('id', metavar='arxiv_id', nargs="*",
           help="arxiv identifier, such as 1201.1213")
         parser.add_argument('-c', '--comments', action='store_true',
@@ -405,7 +1212,36 @@ class Cli(object):
           help="Display fewer error messages")
         parser.add_argument('-v', '--verbose', action="store_true",
           help="Display more error messages")
-        return parser.parse_args(args)
+        parser.add_argument('-k', '--key', choices=KEY_SCHEMES,
+          help="Citation key: the existing key (default with --merge), the "
+               "arxiv id with version (default otherwise), without version, "
+               "or first author, year and first title word")
+        parser.add_argument('-m', '--merge', action='store_true',
+          help="Merge the BibTeX files given as arguments (or stdin) "
+               "into one, removing duplicate papers")
+        parser.add_argument('--fields', metavar='LIST', type=field_list,
+          help="Comma separated BibTeX fields to output, such as "
+               "author,title,year,doi. Other fields are discarded while "
+               "parsing and are not cached or printed.")
+        parser.add_argument('--cache', metavar='FILE',
+          default=os.environ.get('ARXIV2BIB_CACHE'),
+          help="Read and store results in this SQLite file, which can be "
+               "shared by concurrent runs (default: $ARXIV2BIB_CACHE)")
+        parser.add_argument('--max-age', metavar='SECONDS', type=float,
+          help="Cache entries older than this are stale. They are printed "
+               "immediately and revalidated in the background.")
+        parser.add_argument('--revalidate', action='store_true',
+          help="Revalidate stale cache entries before printing them")
+        args = parser.parse_args(args)
+        if (args.max_age is not None or args.revalidate) and not args.cache:
+            parser.error("--max-age and --revalidate require --cache")
+        if args.revalidate and args.max_age is None:
+            parser.error("--revalidate requires --max-age")
+        if args.key == "author-year-title" and args.fields is not None \
+                and "year" not in args.fields and not args.merge:
+            # the key needs the published date, which --fields would prune
+            parser.error("--key author-year-title requires the year field")
+        return args
 
 
 def main(args=None):
@@ -0,0 +1,455 @@
+#! /usr/bin/env python
+"""Load and soak test for arxiv2bib_dict.
+
+Runs concurrent workloads of mixed arxiv ids against a local fake arxiv API
+that can add latency, 403 and 503 responses and malformed XML. Reports
+throughput, latency percentiles and resident memory over time as JSON, so
+runs from different commits can be compared. With --cache, the workers
+share a cache file and the report counts ids the fake API served more
+than once and the time workers spent waiting on each other's fetches.
+
+Examples::
+
+    $ python soak.py --threads 8 --duration 30 --latency 0.05 > before.json
+    $ python soak.py --processes 4 --chunk-size 25,100 --error-ratio 0,0.3
+    $ python soak.py --processes 8 --cache /tmp/soak.sqlite
+    $ python soak.py --compare before.json after.json
+"""
+
+from __future__ import print_function
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+import arxiv2bib as a2b
+
+if a2b.PY2:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+else:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+
+
+FEED = """<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title type="html">ArXiv Query</title>
+%s
+</feed>
+"""
+
+ENTRY = """  <entry>
+    <id>http://arxiv.org/abs/%(id)s</id>
+    <updated>2012-05-04T16:23:05Z</updated>
+    <published>2012-05-04T16:23:05Z</published>
+    <title>%(title)s</title>
+    <summary>%(summary)s</summary>
+    %(authors)s
+    <arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom"
+      term="math.CO" scheme="http://arxiv.org/schemas/atom"/>
+  </entry>"""
+
+ERROR_ENTRY = """  <entry>
+    <id>http://arxiv.org/api/errors#incorrect_id_format_for_%(id)s</id>
+    <title>Error</title>
+    <summary>incorrect id format for %(id)s</summary>
+  </entry>"""
+
+OLD_STYLE_ARCHIVES = ["math", "hep-th", "astro-ph", "cond-mat.soft",
+                      "quant-ph", "cs.DS"]
+
+
+def fake_entry(arxiv_id, abstract_size):
+    """Atom entry for an id, as the arxiv API would return it.
+
+    Ids ending in 9 do not exist and get an entry with no title.
+    """
+    bare = a2b.strip_version(arxiv_id)
+    if bare.endswith("9"):
+        return ENTRY % {"id": arxiv_id, "title": "", "summary": "",
+                        "authors": ""}
+    version = arxiv_id if bare != arxiv_id else bare + "v2"
+    return ENTRY % {
+        "id": version,
+        "title": "On the structure of paper %s" % bare,
+        "summary": ("lorem ipsum " * abstract_size)[:abstract_size],
+        "authors": "\n    ".join(
+          "<author><name>Author %s</name></author>" % i for i in range(3))}
+
+
+def serve_fake_api(options):
+    """Starts the fake API in a thread. Returns the server.
+
+    server.served counts how often each id was sent in a response.
+    """
+    rng = random.Random(options.seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                roll = rng.random()
+                delay = rng.uniform(0, 2 * options.latency)
+            time.sleep(delay)
+            if roll < options.p403:
+                return self.send_error(403)
+            roll -= options.p403
+            if roll < options.p503:
+                return self.send_error(503)
+            roll -= options.p503
+
+            query = parse_qs(urlparse(self.path).query)
+            ids = query.get("id_list", [""])[0].split(",")
+            rejected = [id for id in ids if a2b.NEW_STYLE.match(id) and
+                        int(id[2:4]) > 12]
+            if rejected:
+                body = FEED % (ERROR_ENTRY % {"id": rejected[0]})
+            else:
+                body = FEED % "\n".join(
+                  fake_entry(id, options.abstract_size) for id in ids)
+                with lock:
+                    for id in ids:
+                        served = self.server.served
+                        served[id] = served.get(id, 0) + 1
+            body = body.encode("utf-8")
+            if roll < options.p_malformed:
+                body = body[:len(body) // 2]
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/atom+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = Server(("127.0.0.1", 0), Handler)
+    server.served = {}
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def make_ids(rng, size, error_ratio, duplicate_ratio):
+    """Random mix of arxiv ids.
+
+    A share error_ratio of the ids are split evenly between ids rejected
+    by our validation, ids rejected by the API and ids that do not exist.
+    """
+    ids = []
+    for i in range(size):
+        roll = rng.random()
+        if ids and roll < duplicate_ratio:
+            ids.append(rng.choice(ids))
+            continue
+        roll = rng.random()
+        if roll < error_ratio / 3:
+            ids.append(rng.choice(["x", "1234.567", "math/12",
+                                   "hep-xx/0101001"]))
+        elif roll < 2 * error_ratio / 3:
+            ids.append("%02d%02d.%05d" % (rng.randint(7, 25),
+                                          rng.randint(13, 99),
+                                          rng.randint(0, 99999)))
+        elif roll < error_ratio:
+            ids.append("%04d.%04d9" % (rng.randint(701, 1412),
+                                       rng.randint(0, 9999)))
+        else:
+            if rng.random() < 0.7:
+                arxiv_id = "%02d%02d.%05d" % (rng.randint(7, 25),
+                                              rng.randint(1, 12),
+                                              rng.randint(0, 99998))
+            else:
+                arxiv_id = "%s/%02d%02d%03d" % (
+                  rng.choice(OLD_STYLE_ARCHIVES), rng.randint(92, 99),
+                  rng.randint(1, 12), rng.randint(0, 998))
+            if arxiv_id.endswith("9"):
+                arxiv_id = arxiv_id[:-1] + "8"
+            if rng.random() < 0.3:
+                arxiv_id += "v%d" % rng.randint(1, 4)
+            ids.append(arxiv_id)
+    return ids
+
+
+def classify(error):
+    """Short name for an exception raised by arxiv2bib_dict"""
+    message = str(error)
+    for code in ("403", "503"):
+        if "HTTP Error " + code in message:
+            return "http" + code
+    for text in ("well-formed", "no element found", "unclosed token",
+                 "mismatched tag", "syntax error"):
+        if text in message:
+            return "malformed"
+    return type(error).__name__
+
+
+def timed_cache(path):
+    """Cache on path that counts its waits for other fetches.
+
+    cache.waits holds the number of waits and the seconds spent in them.
+    """
+    cache = a2b.Cache(path)
+    cache.waits = [0, 0.0]
+    wait = cache.wait
+
+    def timed_wait(ids, fields=None):
+        start = time.time()
+        try:
+            return wait(ids, fields)
+        finally:
+            cache.waits[0] += 1
+            cache.waits[1] += time.time() - start
+    cache.wait = timed_wait
+    return cache
+
+
+def worker(url, chunk_size, error_ratio, options, seed, deadline, results):
+    """Calls arxiv2bib_dict until deadline, appending one tuple per call"""
+    a2b.API_URL = url
+    a2b.CHUNK_SIZE = chunk_size
+    rng = random.Random(seed)
+    cache = timed_cache(options.cache) if options.cache else None
+    while time.time() < deadline:
+        ids = make_ids(rng, options.ids, error_ratio,
+                       options.duplicate_ratio)
+        if cache is not None:
+            cache.waits = [0, 0.0]
+        start = time.time()
+        try:
+            d = a2b.arxiv2bib_dict(ids, cache)
+            outcome = "ok"
+            errors = sum(1 for id in set(ids) if
+                         isinstance(d.get(id), a2b.ReferenceErrorInfo) or
+                         id not in d)
+        except Exception as error:
+            outcome = classify(error)
+            errors = 0
+        waits = cache.waits if cache is not None else [0, 0.0]
+        results.append((time.time() - start, outcome, len(ids), errors,
+                        waits[0], waits[1]))
+
+
+def process_worker(url, chunk_size, error_ratio, options, seed, deadline,
+                   queue):
+    """worker() in a separate process, sending results through queue"""
+    results = []
+    worker(url, chunk_size, error_ratio, options, seed, deadline, results)
+    queue.put(results)
+
+
+def rss_kb(pid):
+    """Resident memory of a process in kB, or None if unknown"""
+    try:
+        with open("/proc/%d/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    if pid == os.getpid():
+        try:
+            import resource
+        except ImportError:
+            return None
+        # peak rather than current, but better than nothing
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    rank = int(round(p / 100.0 * (len(values) - 1)))
+    return values[rank]
+
+
+def run(server, chunk_size, error_ratio, options):
+    """One workload at one chunk size and error ratio. Returns a report."""
+    url = "http://127.0.0.1:%d/api/query" % server.server_address[1]
+    deadline = time.time() + options.duration
+    server.served.clear()
+    results = []
+    pids = []
+    if options.processes:
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(
+                     target=process_worker,
+                     args=(url, chunk_size, error_ratio, options,
+                           options.seed + i, deadline, queue))
+                   for i in range(options.processes)]
+    else:
+        workers = [threading.Thread(
+                     target=worker,
+                     args=(url, chunk_size, error_ratio, options,
+                           options.seed + i, deadline, results))
+                   for i in range(options.threads)]
+    start = time.time()
+    for w in workers:
+        w.start()
+    if options.processes:
+        pids = [w.pid for w in workers]
+    else:
+        pids = [os.getpid()]
+
+    rss = []
+    while time.time() < deadline:
+        sizes = [rss_kb(pid) for pid in pids]
+        if None not in sizes:
+            rss.append((round(time.time() - start, 2), sum(sizes)))
+        time.sleep(min(options.sample_interval,
+                       max(0, deadline - time.time())))
+    if options.processes:
+        # drain the queue first; a process cannot exit with unsent results
+        for w in workers:
+            results.extend(queue.get())
+    for w in workers:
+        w.join()
+    elapsed = time.time() - start
+
+    latencies = sorted(r[0] for r in results if r[1] == "ok")
+    outcomes = {}
+    for r in results:
+        outcomes[r[1]] = outcomes.get(r[1], 0) + 1
+    ids = sum(r[2] for r in results if r[1] == "ok")
+    served = list(server.served.values())
+    return {
+        "chunk_size": chunk_size,
+        "error_ratio": error_ratio,
+        "calls": len(results),
+        "outcomes": outcomes,
+        "calls_per_second": round(len(results) / elapsed, 2),
+        "ids_per_second": round(ids / elapsed, 2),
+        "error_entry_ratio": round(
+          sum(r[3] for r in results if r[1] == "ok") / float(ids or 1), 3),
+        "latency": dict(("p%d" % p, percentile(latencies, p))
+                        for p in (50, 90, 99, 100)),
+        "served_ids": sum(served),
+        "refetched_ids": sum(count - 1 for count in served),
+        "cache_waits": sum(r[4] for r in results),
+        "cache_wait_seconds": round(sum(r[5] for r in results), 3),
+        "rss_kb": rss,
+        "rss_kb_max": max([size for t, size in rss] or [None]),
+    }
+
+
+def git_commit():
+    """Commit hash of the arxiv2bib checkout, if available"""
+    try:
+        return subprocess.check_output(
+          ["git", "rev-parse", "HEAD"],
+          cwd=os.path.dirname(os.path.abspath(a2b.__file__))
+          ).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_name, new_name):
+    """Prints the change in key metrics between two reports"""
+    with open(old_name) as f:
+        old = json.load(f)
+    with open(new_name) as f:
+        new = json.load(f)
+    print("%s -> %s" % (old.get("commit"), new.get("commit")))
+    old_runs = dict(((r["chunk_size"], r["error_ratio"]), r)
+                    for r in old["runs"])
+    for run in new["runs"]:
+        key = (run["chunk_size"], run["error_ratio"])
+        if key not in old_runs:
+            continue
+        print("chunk_size=%s error_ratio=%s" % key)
+        for metric in ("calls_per_second", "ids_per_second", "rss_kb_max",
+                       "refetched_ids", "cache_waits", "cache_wait_seconds"):
+            print("  %-18s %10s -> %s" % (metric, old_runs[key].get(metric),
+                                          run.get(metric)))
+        for p, value in sorted(run["latency"].items()):
+            print("  latency %-10s %10s -> %s" % (
+              p, old_runs[key]["latency"].get(p), value))
+
+
+def parse_args(args):
+    import argparse
+
+    def number_list(string):
+        return [float(x) for x in string.split(",")]
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--threads", type=int, default=4,
+      help="Number of worker threads (default: 4)")
+    parser.add_argument("--processes", type=int, default=0,
+      help="Use this many worker processes instead of threads")
+    parser.add_argument("--duration", type=float, default=10,
+      help="Seconds to run each workload (default: 10)")
+    parser.add_argument("--ids", type=int, default=50,
+      help="Ids per arxiv2bib_dict call (default: 50)")
+    parser.add_argument("--chunk-size", type=number_list, default=[100],
+      help="Comma separated chunk sizes to run (default: 100)")
+    parser.add_argument("--error-ratio", type=number_list, default=[0.1],
+      help="Comma separated shares of bad ids to run (default: 0.1)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1,
+      help="Share of repeated ids (default: 0.1)")
+    parser.add_argument("--latency", type=float, default=0.02,
+      help="Mean fake API latency in seconds (default: 0.02)")
+    parser.add_argument("--p403", type=float, default=0,
+      help="Probability of a 403 response")
+    parser.add_argument("--p503", type=float, default=0,
+      help="Probability of a 503 response")
+    parser.add_argument("--p-malformed", type=float, default=0,
+      help="Probability of truncated XML")
+    parser.add_argument("--abstract-size", type=int, default=1200,
+      help="Characters per fake abstract (default: 1200)")
+    parser.add_argument("--sample-interval", type=float, default=0.5,
+      help="Seconds between memory samples (default: 0.5)")
+    parser.add_argument("--cache", metavar="FILE",
+      help="Cache file shared by all workers and workloads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", nargs=2, metavar="REPORT",
+      help="Compare two JSON reports instead of running")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    options = parse_args(args)
+    if options.compare:
+        compare(*options.compare)
+        return 0
+
+    server = serve_fake_api(options)
+    runs = []
+    try:
+        for chunk_size in options.chunk_size:
+            for error_ratio in options.error_ratio:
+                report = run(server, int(chunk_size), error_ratio, options)
+                sys.stderr.write(
+                  "chunk_size=%(chunk_size)s error_ratio=%(error_ratio)s: "
+                  "%(calls_per_second)s calls/s, %(ids_per_second)s ids/s, "
+                  "max rss %(rss_kb_max)s kB\n" % report)
+                runs.append(report)
+    finally:
+        server.shutdown()
+
+    config = dict(vars(options))
+    del config["compare"]
+    json.dump({"commit": git_commit(), "python": sys.version.split()[0],
+               "config": config, "runs": runs}, sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
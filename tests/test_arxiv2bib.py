@@ -1,6 +1,9 @@
 #! /usr/bin/env python
 
 import arxiv2bib as a2b
+import os
+import shutil
+import tempfile
 import unittest
 from mock import patch, Mock
 from xml.etree import ElementTree
@@ -8,6 +11,7 @@ try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
+from io import BytesIO
 
 # provides fake data for 1001.1001v1 and 1205.1001v1
 DATA = """<?xml version="1.0" encoding="utf-8"?>
@@ -107,6 +111,265 @@ class testArxivRequest(unittest.TestCase):
         cli = a2b.Cli(['0000.0000'])
         self.assertRaises(a2b.FatalError, cli.run)
 
+    @patch('arxiv2bib.urlopen',
+           side_effect=lambda url: BytesIO(DATA.encode('utf-8')))
+    def test_arxiv_request_prunes_fields(self, mock_urlopen):
+        xml = a2b.arxiv_request(['1205.1001v1', '1001.1001v1'], ['year'])
+        entries = xml.findall(a2b.ATOM + 'entry')
+        self.assertEqual(len(entries), 2)
+        self.assertEqual([child.tag for child in entries[0]],
+          [a2b.ATOM + tag for tag in ['id', 'updated', 'published', 'title',
+                                      'author', 'author', 'author']])
+        self.assertEqual(len(xml), 2)
+
+    @patch('arxiv2bib.urlopen')
+    def test_arxiv_request_keeps_error_entries(self, mock_urlopen):
+        error = """<feed xmlns="http://www.w3.org/2005/Atom"><entry>
+          <id>http://arxiv.org/api/errors#incorrect_id_format_for_x</id>
+          <title>Error</title>
+          <summary>incorrect id format for 1234.1234</summary>
+          </entry></feed>"""
+        mock_urlopen.side_effect = lambda url: BytesIO(error.encode('utf-8'))
+        xml = a2b.arxiv_request(['1234.1234'], ['title'])
+        summary = xml.find(a2b.ATOM + 'entry/' + a2b.ATOM + 'summary')
+        self.assertEqual(summary.text, 'incorrect id format for 1234.1234')
+
+
+class testFields(unittest.TestCase):
+    def setUp(self):
+        fakedata.start()
+
+    def tearDown(self):
+        fakedata.stop()
+
+    def test_only_requested_fields_extracted(self):
+        ref = a2b.arxiv2bib(['1205.1001'], fields=['Title', 'year'])[0]
+        self.assertEqual(ref.summary, '')
+        self.assertEqual(ref.authors, [])
+        self.assertEqual(ref.year, '2012')
+        self.assertEqual(ref.bare_id, '1205.1001')
+
+    def test_only_requested_fields_output(self):
+        ref = a2b.arxiv2bib(['1001.1001'], fields=['author'])[0]
+        expected = '@article{1001.1001v1,\nAuthor        = {Philip G. Judge}\n}'
+        self.assertEqual(ref.bibtex(), expected)
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, a2b.arxiv2bib, ['1001.1001'],
+                          fields=['foo'])
+
+    def test_cli_fields_argument(self):
+        cli = a2b.Cli(['--fields', 'author,Title', '1001.1001'])
+        cli.run()
+        self.assertEqual(cli.args.fields, frozenset(['author', 'title']))
+        self.assertFalse('Abstract' in cli.output[0])
+
+
+BIB = """@article{1001.1001v1,
+Author        = {Philip G. Judge},
+Title         = {The chromosphere: gateway to the corona},
+Eprint        = {1001.1001v1},
+Year          = {2010}
+}
+@comment{x: Invalid arXiv identifier}
+@article{foo,
+  author = "Fischer, Timo and Vink, R.",
+  title = {Membrane lateral {structure}},
+  doi = {10.1/ABC},
+  year = 2012,
+}
+"""
+
+BIB2 = """@article{1001.1001v2,
+Author        = {Philip G. Judge},
+Title         = {The Chromosphere: Gateway to the Corona},
+Eprint        = {1001.1001v2},
+DOI           = {10.2/x}
+}
+@comment{x: Invalid arXiv identifier}
+@article{bar, doi={https://doi.org/10.1/abc}, note={J. Foo}}
+@article{baz, title={The chromosphere: gateway to the {corona}},
+  author={Judge, P. G.}}
+"""
+
+
+class testMerge(unittest.TestCase):
+    def merged(self, key_scheme='id'):
+        bib = a2b.Bibliography(key_scheme)
+        for entry in a2b.parse_bibtex(BIB + BIB2):
+            bib.add(entry)
+        return bib
+
+    def test_parse_bibtex(self):
+        entries = list(a2b.parse_bibtex(BIB))
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(entries[0].key, '1001.1001v1')
+        self.assertEqual(entries[1].raw, '@comment{x: Invalid arXiv identifier}')
+        self.assertEqual(entries[2].fields, [
+          ('author', 'Fischer, Timo and Vink, R.'),
+          ('title', 'Membrane lateral {structure}'),
+          ('doi', '10.1/ABC'),
+          ('year', '2012')])
+
+    def test_parse_parentheses(self):
+        entries = list(a2b.parse_bibtex("@article(foo, title={A (B)})"))
+        self.assertEqual(entries[0].key, 'foo')
+        self.assertEqual(entries[0].fields, [('title', 'A (B)')])
+
+    def test_parse_verbatim_values(self):
+        entry = list(a2b.parse_bibtex(
+          '@article{foo, month = jan, note = "A" # b, year = 2012}'))[0]
+        self.assertEqual(entry.fields,
+          [('month', 'jan'), ('note', '"A" # b'), ('year', '2012')])
+        self.assertEqual(entry.bibtex().split('\n')[1:], [
+          'month         = jan,', 'note          = "A" # b,',
+          'year          = 2012', '}'])
+
+    def test_parse_errors(self):
+        for text in ('@article{foo, title={A}\n@article{bar, title={B}}',
+                     '@article{foo, title="A}"}',
+                     '@article{foo, title={A} junk}',
+                     '@article{foo, title=}'):
+            self.assertRaises(a2b.BibTeXError, list, a2b.parse_bibtex(text))
+
+    def test_parse_error_line_number(self):
+        text = '@article{foo, title={A}}\n\n@article{bar, title=}'
+        try:
+            list(a2b.parse_bibtex(text))
+        except a2b.BibTeXError as error:
+            self.assertTrue(str(error).startswith('line 3:'))
+        else:
+            self.fail('no BibTeXError')
+
+    def test_parse_does_not_rescan(self):
+        class Text(str):
+            scanned = 0
+
+            def count(self, sub, start=0, end=None):
+                Text.scanned += len(self)
+                return str.count(self, sub, start, end)
+
+        text = Text('@article{foo, title={A}}\n' * 200)
+        self.assertEqual(len(list(a2b.parse_bibtex(text))), 200)
+        self.assertTrue(Text.scanned <= len(text))
+
+    def test_duplicates_joined_through_later_entry(self):
+        bib = a2b.Bibliography()
+        for entry in a2b.parse_bibtex("""
+            @article{a, doi={X}}
+            @article{b, eprint={1001.1001}}
+            @article{c, doi={X}, eprint={1001.1001v2}}"""):
+            bib.add(entry)
+        output = bib.bibtex()
+        self.assertEqual(len(output), 1)
+        self.assertEqual(output[0][:10], '@article{c')
+
+    def test_same_title_different_papers(self):
+        bib = a2b.Bibliography()
+        for entry in a2b.parse_bibtex("""
+            @article{a, title={Introduction}, author={Ann Smith}}
+            @article{b, title={Introduction}, author={Bob Jones}, year=2001}
+            @article{c, title={Introduction}, year=2001}
+            @article{d, title={Introduction}, year=2002}
+            @article{e, title={Introduction}}"""):
+            bib.add(entry)
+        self.assertEqual(len(bib.bibtex()), 5)
+
+    def test_duplicates_collapsed(self):
+        entries = self.merged().entries
+        self.assertEqual(len(entries), 3)
+        judge, comment, fischer = entries
+        self.assertEqual(judge.eprint(), '1001.1001v2')
+        self.assertEqual(judge.get('Year'), '2010')
+        self.assertEqual(fischer.get('Note'), 'J. Foo')
+
+    def test_merge_keeps_existing_keys(self):
+        bib = a2b.Bibliography()
+        for entry in a2b.parse_bibtex(
+          '@article{judge2010, eprint={1001.1001v1}}'):
+            bib.add(entry)
+        self.assertEqual(bib.bibtex()[0][:18], '@article{judge2010')
+
+    def test_key_schemes(self):
+        output = self.merged('bare').bibtex()
+        self.assertEqual(output[0][:19], '@article{1001.1001,')
+        self.assertEqual(output[2][:13], '@article{foo,')
+        output = self.merged('author-year-title').bibtex()
+        self.assertEqual(output[0][:31], '@article{Judge2010chromosphere,')
+        self.assertEqual(output[2][:29], '@article{Fischer2012membrane,')
+
+    def test_citation_key(self):
+        key = a2b.citation_key('author-year-title', '1205.1001v1',
+                               ['Timo Fischer'], '2012',
+                               'The influence of {\\it immobilized} particles')
+        self.assertEqual(key, 'Fischer2012influence')
+        self.assertEqual(a2b.citation_key('author-year-title', '1205.1001v1'),
+                         '1205.1001v1')
+
+    def test_unique_key(self):
+        used = set()
+        keys = [a2b.unique_key('a', used) for i in range(3)]
+        self.assertEqual(keys, ['a', 'ab', 'ac'])
+
+    @patch('arxiv2bib.io.open')
+    def test_cli_merge(self, mock_open):
+        mock_open.return_value.__enter__.return_value.read.side_effect = \
+          [BIB, BIB2]
+        cli = a2b.Cli(['--merge', '-k', 'bare', 'a.bib', 'b.bib'])
+        cli.run()
+        self.assertEqual(len(cli.output), 3)
+        self.assertEqual(cli.output[0][:19], '@article{1001.1001,')
+        self.assertEqual(cli.code, 0)
+
+    @patch('arxiv2bib.io.open')
+    def test_cli_merge_default_key(self, mock_open):
+        mock_open.return_value.__enter__.return_value.read.side_effect = \
+          [BIB]
+        cli = a2b.Cli(['--merge', 'a.bib'])
+        cli.run()
+        self.assertEqual(cli.output[2][:13], '@article{foo,')
+
+    @patch('arxiv2bib.io.open')
+    def test_cli_merge_parse_error(self, mock_open):
+        mock_open.return_value.__enter__.return_value.read.side_effect = \
+          ['@article{foo, title={A}']
+        cli = a2b.Cli(['--merge', 'a.bib'])
+        self.assertRaises(a2b.FatalError, cli.run)
+
+    def test_cli_default_key_unchanged(self):
+        with fakedata:
+            cli = a2b.Cli(['1001.1001', '1001.1001v1', '1001.1001'])
+            cli.run()
+        self.assertEqual([o[:21] for o in cli.output],
+                         ['@article{1001.1001v1,'] * 3)
+
+    def test_cli_key_argument(self):
+        with fakedata:
+            cli = a2b.Cli(['-k', 'author-year-title', '1001.1001',
+                           '1001.1001v1'])
+            cli.run()
+        self.assertEqual(cli.output[0][:31], '@article{Judge2010chromosphere,')
+        self.assertEqual(cli.output[1][:31], '@article{Judge2010chromosphere,')
+
+    @patch('sys.stderr', new_callable=StringIO)
+    def test_cli_key_argument_needs_year(self, mock_err):
+        self.assertRaises(SystemExit, a2b.Cli,
+          ['-k', 'author-year-title', '--fields', 'doi', '1001.1001'])
+        with fakedata:
+            cli = a2b.Cli(['-k', 'author-year-title', '--fields', 'year',
+                           '1001.1001'])
+            cli.run()
+        self.assertEqual(cli.output[0][:31], '@article{Judge2010chromosphere,')
+
+    def test_cli_key_argument_collision(self):
+        cli = a2b.Cli(['-k', 'author-year-title', '1001.1001', '1002.1002'])
+        refs = [Mock(bare_id=bare_id, key=lambda scheme: 'Judge2010a',
+                     bibtex=lambda key: key)
+                for bare_id in ('1001.1001', '1002.1002', '1001.1001')]
+        cli.create_output(refs)
+        self.assertEqual(cli.output,
+                         ['Judge2010a', 'Judge2010ab', 'Judge2010a'])
+
 
 class testRegularExpressions(unittest.TestCase):
     def test_new_style_no_version(self):
@@ -281,3 +544,268 @@ class testCLI(unittest.TestCase):
         code = a2b.main(['1001.1001'])
         self.assertEqual(code, 2)
         self.assertEqual(mock_err.getvalue().strip(), 'xxx')
+
+
+class testCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.sqlite')
+        self.cache = a2b.Cache(self.path, wait_timeout=1, poll_interval=0.01)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_second_lookup_uses_cache(self):
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1001.1001', '1205.1001v1'], self.cache)
+            result = a2b.arxiv2bib(['1001.1001', '1205.1001v1'], self.cache)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(result[0].id, '1001.1001v1')
+        self.assertEqual(result[1].authors[0], 'Timo Fischer')
+
+    def test_cache_shared_between_connections(self):
+        with fakedata:
+            a2b.arxiv2bib(['1001.1001'], self.cache)
+        other = a2b.Cache(self.path)
+        self.assertEqual(list(other.get(['1001.1001', '1205.1001'])),
+                         ['1001.1001'])
+        other.close()
+
+    def test_not_found_is_cached(self):
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1011.9999'], self.cache)
+            result = a2b.arxiv2bib(['1011.9999'], self.cache)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(type(result[0]), a2b.ReferenceErrorInfo)
+        self.assertEqual(self.cache.get(['1011.9999']), {'1011.9999': None})
+
+    def test_not_found_expires(self):
+        with fakedata:
+            a2b.arxiv2bib(['1011.9999'], self.cache)
+        self.cache.not_found_ttl = 0
+        self.cache.db.execute("UPDATE entries SET fetched = 0")
+        self.assertEqual(self.cache.get(['1011.9999']), {})
+
+    def test_wait_for_not_found(self):
+        other = a2b.Cache(self.path)
+        other.claim(['1011.9999'])
+        other.put(['1011.9999'], [])
+        other.release(['1011.9999'])
+        with fakedata as mock_request:
+            result = a2b.arxiv2bib(['1011.9999'], self.cache)
+        mock_request.assert_not_called()
+        self.assertEqual(type(result[0]), a2b.ReferenceErrorInfo)
+        other.close()
+
+    def test_claimed_id_is_not_claimed_again(self):
+        other = a2b.Cache(self.path)
+        self.assertEqual(other.claim(['1001.1001']), ['1001.1001'])
+        self.assertEqual(self.cache.claim(['1001.1001', '1205.1001']),
+                         ['1205.1001'])
+        other.close()
+
+    def test_wait_for_other_process(self):
+        other = a2b.Cache(self.path)
+        other.claim(['1001.1001'])
+        other.put(['1001.1001'], ElementTree.fromstring(DATA).findall(
+          a2b.ATOM + 'entry'))
+        other.release(['1001.1001'])
+        with fakedata as mock_request:
+            result = a2b.arxiv2bib(['1001.1001'], self.cache)
+        mock_request.assert_not_called()
+        self.assertEqual(result[0].id, '1001.1001v1')
+        other.close()
+
+    def test_put_uses_one_transaction(self):
+        statements = []
+        self.cache.db.set_trace_callback(statements.append)
+        ids = ['1001.%04d' % i for i in range(200)]
+        self.cache.put(ids, [])
+        self.assertEqual(statements.count('BEGIN IMMEDIATE'), 1)
+        self.assertEqual(len(self.cache.get(ids)), 200)
+
+    def test_transaction_rolls_back(self):
+        def failing_write():
+            with self.cache.transaction():
+                self.cache.db.execute(
+                  "INSERT INTO claims VALUES ('1001.1001', 1, 0)")
+                raise ValueError
+        self.assertRaises(ValueError, failing_write)
+        self.assertEqual(self.cache.claim(['1001.1001']), ['1001.1001'])
+
+    def test_wait_sees_result_stored_while_checking(self):
+        other = a2b.Cache(self.path)
+        other.claim(['1001.1001'])
+        get = self.cache.get
+        def get_then_finish(ids, fields=None):
+            found = get(ids, fields)
+            if other.db.execute("SELECT 1 FROM claims").fetchone():
+                other.put(['1001.1001'], ElementTree.fromstring(DATA).findall(
+                  a2b.ATOM + 'entry'))
+                other.release(['1001.1001'])
+            return found
+        with patch.object(self.cache, 'get', side_effect=get_then_finish):
+            found, missing = self.cache.wait(['1001.1001'])
+        self.assertEqual(list(found), ['1001.1001'])
+        self.assertEqual(missing, [])
+        other.close()
+
+    def test_no_fetch_if_stored_before_claim(self):
+        other = a2b.Cache(self.path)
+        claim = self.cache.claim
+        def finish_then_claim(ids):
+            other.put(['1001.1001'], ElementTree.fromstring(DATA).findall(
+              a2b.ATOM + 'entry'))
+            return claim(ids)
+        with patch.object(self.cache, 'claim', side_effect=finish_then_claim):
+            with fakedata as mock_request:
+                result = a2b.arxiv2bib(['1001.1001'], self.cache)
+        mock_request.assert_not_called()
+        self.assertEqual(result[0].id, '1001.1001v1')
+        other.close()
+
+    def test_stale_claim_is_fetched(self):
+        other = a2b.Cache(self.path)
+        other.claim(['1001.1001'])
+        other.db.execute("UPDATE claims SET started = 0")
+        with fakedata as mock_request:
+            result = a2b.arxiv2bib(['1001.1001'], self.cache)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(result[0].id, '1001.1001v1')
+        other.close()
+
+    def test_fetch_after_wait_timeout_is_stored(self):
+        self.cache.wait_timeout = 0.05
+        other = a2b.Cache(self.path)
+        other.claim(['1001.1001'])
+        with fakedata as mock_request:
+            result = a2b.arxiv2bib(['1001.1001'], self.cache)
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(result[0].id, '1001.1001v1')
+        self.assertEqual(list(self.cache.get(['1001.1001'])), ['1001.1001'])
+        other.close()
+
+    def test_cli_cache_argument(self):
+        with fakedata as mock_request:
+            a2b.Cli(['--cache', self.path, '1001.1001']).run()
+            cli = a2b.Cli(['--cache', self.path, '1001.1001'])
+            cli.run()
+        self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(cli.code, 0)
+
+    def make_stale(self):
+        self.cache.db.execute("UPDATE entries SET fetched = 0")
+
+    def test_stale_entries(self):
+        with fakedata:
+            a2b.arxiv2bib(['1001.1001', '1205.1001v1'], self.cache)
+        self.assertEqual(self.cache.stale(['1001.1001']), [])
+        self.cache.max_age = 3600
+        self.assertEqual(self.cache.stale(['1001.1001']), [])
+        self.make_stale()
+        self.assertEqual(self.cache.stale(['1001.1001', '1011.9999']),
+                         ['1001.1001'])
+
+    def test_revalidate_unchanged(self):
+        self.cache.max_age = 3600
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1001.1001'], self.cache)
+            self.make_stale()
+            result = a2b.arxiv2bib(['1001.1001'], self.cache, True)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(result[0].id, '1001.1001v1')
+        self.assertEqual(self.cache.stale(['1001.1001']), [])
+
+    def test_revalidate_new_version(self):
+        self.cache.max_age = 3600
+        with fakedata:
+            a2b.arxiv2bib(['1001.1001'], self.cache)
+        self.make_stale()
+        new = DATA.replace('1001.1001v1', '1001.1001v2').replace(
+          '2010-01-06T22:12:29Z', '2012-01-01T00:00:00Z')
+        with patch('arxiv2bib.arxiv_request',
+                   return_value=ElementTree.fromstring(new)):
+            changed = self.cache.revalidate(['1001.1001'])
+        self.assertEqual(changed, ['1001.1001'])
+        with fakedata as mock_request:
+            result = a2b.arxiv2bib(['1001.1001'], self.cache)
+        mock_request.assert_not_called()
+        self.assertEqual(result[0].id, '1001.1001v2')
+
+    def test_revalidate_missing_from_response(self):
+        self.cache.max_age = 3600
+        with fakedata:
+            a2b.arxiv2bib(['1001.1001'], self.cache)
+        self.make_stale()
+        with patch('arxiv2bib.arxiv_request',
+                   return_value=ElementTree.fromstring(
+                     '<feed xmlns="http://www.w3.org/2005/Atom"/>')):
+            changed = self.cache.revalidate(['1001.1001'])
+        self.assertEqual(changed, [])
+        self.assertEqual(self.cache.stale(['1001.1001']), [])
+
+    def test_revalidate_marks_fresh_in_one_transaction(self):
+        self.cache.max_age = 3600
+        with fakedata:
+            a2b.arxiv2bib(['1001.1001', '1205.1001'], self.cache)
+        self.make_stale()
+        statements = []
+        self.cache.db.set_trace_callback(statements.append)
+        with fakedata:
+            self.cache.revalidate(['1001.1001', '1205.1001'])
+        updates = [i for i, st in enumerate(statements)
+                   if st.startswith('UPDATE entries')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(statements[updates[0] - 1], 'BEGIN IMMEDIATE')
+        self.assertEqual(statements[updates[-1] + 1], 'COMMIT')
+
+    @patch('sys.stderr', new_callable=StringIO)
+    def test_cli_rejects_useless_revalidation_options(self, mock_err):
+        for args in (['--max-age', '60', 'x'], ['--revalidate', 'x'],
+                     ['--cache', self.path, '--revalidate', 'x']):
+            self.assertRaises(SystemExit, a2b.Cli, args)
+
+    @patch('arxiv2bib.subprocess.Popen')
+    def test_cli_stale_while_revalidate(self, mock_popen):
+        with fakedata:
+            a2b.Cli(['--cache', self.path, '1001.1001']).run()
+        self.make_stale()
+        with fakedata as mock_request:
+            cli = a2b.Cli(['--cache', self.path, '--max-age', '60',
+                           '1001.1001'])
+            cli.run()
+        mock_request.assert_not_called()
+        self.assertEqual(cli.output[0][:22], '@article{1001.1001v1,\n')
+        args = mock_popen.call_args[0][0]
+        self.assertTrue('--revalidate' in args)
+        mock_popen.return_value.stdin.write.assert_called_with(b'1001.1001')
+
+    def test_projected_entry_not_used_for_more_fields(self):
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1001.1001'], self.cache, fields=['title'])
+            a2b.arxiv2bib(['1001.1001'], self.cache, fields=['title'])
+            self.assertEqual(mock_request.call_count, 1)
+            ref = a2b.arxiv2bib(['1001.1001'], self.cache)[0]
+            self.assertEqual(mock_request.call_count, 2)
+        self.assertTrue(ref.summary.startswith('I argue'))
+
+    def test_projected_entry_stores_only_needed_elements(self):
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1001.1001'], self.cache, fields=['doi'])
+            ref = a2b.arxiv2bib(['1001.1001'], self.cache,
+                                fields=['title', 'author'])[0]
+            self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(ref.authors, ['Philip G. Judge'])
+        xml = bytes(self.cache.db.execute(
+          "SELECT xml FROM entries WHERE key = '1001.1001'").fetchone()[0])
+        for tag in (b'summary', b'link', b'published', b'primary_category'):
+            self.assertFalse(tag in xml, tag)
+
+    def test_projected_entry_tagged_with_sibling_fields(self):
+        with fakedata as mock_request:
+            a2b.arxiv2bib(['1001.1001'], self.cache, fields=['year'])
+            ref = a2b.arxiv2bib(['1001.1001'], self.cache,
+                                fields=['month'])[0]
+            self.assertEqual(mock_request.call_count, 1)
+        self.assertEqual(ref.month, 'Jan')